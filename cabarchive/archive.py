@@ -8,13 +8,20 @@
 # pylint: disable=protected-access
 
 import fnmatch
+import mmap
+import os
+import re
+import traceback
 
-from typing import Optional, List
+from typing import Optional, List, Union
 
 from cabarchive.file import CabFile
 from cabarchive.parser import CabArchiveParser
 from cabarchive.writer import CabArchiveWriter
 
+# characters that make a filename a glob rather than an exact match
+_GLOB_MAGIC = frozenset("*?[")
+
 
 class CabArchive(dict):
     """This instance allows parsing or writing a MS Cabinet archive.
@@ -45,13 +52,22 @@ class CabArchive(dict):
             f.write(arc.save())
     """
 
-    def __init__(self, buf: Optional[bytes] = None, flattern: bool = False):
+    def __init__(
+        self,
+        buf: Optional[bytes] = None,
+        flattern: bool = False,
+        verify_checksum: bool = True,
+    ):
         """Creates a CabArchive instance.
 
         Args:
             self: A CabArchive instance.
             buf: Binary blob loaded from disk.
             flattern: Disregard archive directory structure wen loading.
+            verify_checksum: Verify the CFDATA checksums when loading; disabling
+                this makes loading faster but corrupt data will not be detected.
+                Setting ``CABARCHIVE_SKIP_CHECKSUM=1`` in the environment
+                disables verification even if this is ``True``.
 
         Raises:
             CorruptionError: The cab file was invalid or corrupt.
@@ -63,7 +79,9 @@ class CabArchive(dict):
 
         # load archive
         if buf:
-            CabArchiveParser(self, flattern=flattern).parse(buf)
+            CabArchiveParser(
+                self, flattern=flattern, verify_checksum=verify_checksum
+            ).parse(buf)
 
     def __setitem__(self, key: str, val: CabFile) -> None:
         assert isinstance(key, str)
@@ -71,19 +89,57 @@ class CabArchive(dict):
         val.filename = key
         dict.__setitem__(self, key, val)
 
-    def parse(self, buf: bytes) -> None:
+    def parse(self, buf: Union[bytes, mmap.mmap], verify_checksum: bool = True) -> None:
         """Parse .cab binary data
 
         Args:
             self: A CabArchive instance.
             bytes: Binary blob loaded from disk.
+            verify_checksum: Verify the CFDATA checksums; disabling this makes
+                parsing faster but corrupt data will not be detected.
+                Setting ``CABARCHIVE_SKIP_CHECKSUM=1`` in the environment
+                disables verification even if this is ``True``.
 
         Raises:
             CorruptionError: The cab file was invalid or corrupt.
             NotSupportedError: The format was not supported, e.g. unknown compression.
 
         """
-        CabArchiveParser(self).parse(buf)
+        CabArchiveParser(self, verify_checksum=verify_checksum).parse(buf)
+
+    def parse_file(self, filename: str, verify_checksum: bool = True) -> None:
+        """Parse a .cab file on disk
+
+        The file is memory mapped rather than read into memory, so only the
+        parts of the archive that are needed get paged in.
+
+        Args:
+            self: A CabArchive instance.
+            filename: The cabinet file to load.
+            verify_checksum: Verify the CFDATA checksums; disabling this makes
+                parsing faster but corrupt data will not be detected.
+                Setting ``CABARCHIVE_SKIP_CHECKSUM=1`` in the environment
+                disables verification even if this is ``True``.
+
+        Raises:
+            CorruptionError: The cab file was invalid or corrupt.
+            NotSupportedError: The format was not supported, e.g. unknown compression.
+        """
+        with open(filename, "rb") as f:
+            try:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty files cannot be mapped
+                self.parse(f.read(), verify_checksum=verify_checksum)
+                return
+        with buf:
+            try:
+                self.parse(buf, verify_checksum=verify_checksum)
+            except Exception as e:
+                # the traceback holds views of the mapping, which would stop
+                # it from being closed
+                traceback.clear_frames(e.__traceback__)
+                raise
 
     def find_file(self, glob: str) -> Optional[CabFile]:
         """Gets a file from the archive using a glob.
@@ -94,10 +150,12 @@ class CabArchive(dict):
         Returns:
             The first CabFile that matches the filename glob, or None.
         """
-        for fn in self:
-            if fnmatch.fnmatch(fn, glob):
-                return self[fn]
-        return None
+        # an exact filename is the common case and needs no pattern matching
+        if glob in self and not _GLOB_MAGIC.intersection(glob):
+            return self[glob]
+        # compile the pattern once and stop at the first match
+        match = re.compile(fnmatch.translate(os.path.normcase(glob))).match
+        return next((self[fn] for fn in self if match(os.path.normcase(fn))), None)
 
     def find_files(self, glob: str) -> List[CabFile]:
         """Gets files from the archive using a glob.
@@ -108,23 +166,47 @@ class CabArchive(dict):
         Returns:
             All CabFile object that matches the filename glob, or None.
         """
-        arr = []
-        for fn in self:
-            if fnmatch.fnmatch(fn, glob):
-                arr.append(self[fn])
-        return arr
+        return [self[fn] for fn in fnmatch.filter(self, glob)]
 
-    def save(self, compress: bool = False, sort: bool = True) -> bytes:
+    def save(
+        self, compress: bool = False, sort: bool = True, compress_level: int = 6
+    ) -> bytes:
         """Returns cabinet file data, optionally compressed
 
         Args:
             self: A CabArchive instance.
             compress: If the binary data should be compressed.
             sort: If the file lists should be sorted in a predictable order
+            compress_level: The zlib compression level, from 1 (fastest) to 9 (smallest)
         Returns:
             The blob of memory that can be written to disk.
         """
-        return CabArchiveWriter(self, compress=compress, sort=sort).write()
+        return CabArchiveWriter(
+            self, compress=compress, sort=sort, compress_level=compress_level
+        ).write()
+
+    def save_file(
+        self,
+        filename: str,
+        compress: bool = False,
+        sort: bool = True,
+        compress_level: int = 6,
+    ) -> None:
+        """Writes cabinet file data to disk, optionally compressed
+
+        Args:
+            self: A CabArchive instance.
+            filename: The cabinet file to write.
+            compress: If the binary data should be compressed.
+            sort: If the file lists should be sorted in a predictable order
+            compress_level: The zlib compression level, from 1 (fastest) to 9 (smallest)
+        """
+        # write the buffer directly rather than copying it into bytes first
+        buf = CabArchiveWriter(
+            self, compress=compress, sort=sort, compress_level=compress_level
+        ).write_buffer()
+        with open(filename, "wb") as f:
+            f.write(buf)
 
     def __repr__(self) -> str:
         return f"CabArchive({[str(self[cabfile]) for cabfile in self]})"
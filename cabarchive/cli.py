@@ -68,8 +68,7 @@ def main():
     for arg in argv:
         arc = CabArchive()
         try:
-            with open(arg, "rb") as f:
-                arc.parse(f.read())
+            arc.parse_file(arg)
         except NotSupportedError as e:
             if not args.autorepack:
                 print(f"Failed to parse: {str(e)}; perhaps try --autorepack")
@@ -80,9 +79,13 @@ def main():
             for fn in arc:
                 print(fn)
         if args.decompress:
+            dirnames = set()
             for fn in arc:
                 path = os.path.join(args.outdir, fn)
-                os.makedirs(os.path.dirname(path), exist_ok=True)
+                dirname = os.path.dirname(path)
+                if dirname not in dirnames:
+                    os.makedirs(dirname, exist_ok=True)
+                    dirnames.add(dirname)
                 with open(path, "wb") as f:
                     print(f"Writing {fn}:")
                     f.write(arc[fn].buf)
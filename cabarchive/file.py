@@ -14,7 +14,14 @@ def _is_ascii(text: str) -> bool:
     """Check if a string is ASCII only"""
     if not text:
         return False
-    return all(ord(c) < 128 for c in text)
+    return text.isascii()
+
+
+# readonly, hidden, system, arch, exec and UTF-8 name flags for each attribute byte
+_ATTR_DECODE = tuple(
+    tuple(bool(attr & bit) for bit in (0x01, 0x02, 0x04, 0x20, 0x40, 0x80))
+    for attr in range(0x100)
+)
 
 
 class CabFile:
@@ -42,12 +49,10 @@ class CabFile:
         self.buf = buf  #: bytes to use for the file contents
         self.date: Optional[datetime.date]  #: date the file was created
         self.time: Optional[datetime.time]  #: time the file was created
-        if mtime:
-            self.date = mtime.date()
-            self.time = mtime.time()
-        else:
-            self.date = datetime.date.today()
-            self.time = datetime.datetime.now().time()
+        if not mtime:
+            mtime = datetime.datetime.now()
+        self.date = mtime.date()
+        self.time = mtime.time()
         self.is_readonly = False  #: set if file is read-only
         self.is_hidden = False  #: set if file is hidden
         self.is_system = False  #: set if file is a system file
@@ -67,36 +72,40 @@ class CabFile:
     def filename(self, filename: str) -> None:
         self.is_name_utf8 = not _is_ascii(filename)
         self._filename = filename
+        self._filename_win32_cache: Optional[bytes] = None
 
     @property
     def _filename_win32(self) -> Optional[str]:
         return self._filename.replace("/", "\\")
 
+    @property
+    def _filename_win32_utf8(self) -> bytes:
+        """The encoded archive filename, cached until the filename changes"""
+        if self._filename_win32_cache is None:
+            self._filename_win32_cache = (self._filename_win32 or "").encode()
+        return self._filename_win32_cache
+
     def _attr_encode(self) -> int:
         """Get attributes on the file"""
-        attr = 0x00
-        if self.is_readonly:
-            attr += 0x01
-        if self.is_hidden:
-            attr += 0x02
-        if self.is_system:
-            attr += 0x04
-        if self.is_arch:
-            attr += 0x20
-        if self.is_exec:
-            attr += 0x40
-        if self.is_name_utf8:
-            attr += 0x80
-        return attr
+        return (
+            bool(self.is_readonly) * 0x01
+            | bool(self.is_hidden) * 0x02
+            | bool(self.is_system) * 0x04
+            | bool(self.is_arch) * 0x20
+            | bool(self.is_exec) * 0x40
+            | bool(self.is_name_utf8) * 0x80
+        )
 
     def _attr_decode(self, attr: int) -> None:
         """Set attributes on the file"""
-        self.is_readonly = bool(attr & 0x01)
-        self.is_hidden = bool(attr & 0x02)
-        self.is_system = bool(attr & 0x04)
-        self.is_arch = bool(attr & 0x20)
-        self.is_exec = bool(attr & 0x40)
-        self.is_name_utf8 = bool(attr & 0x80)
+        (
+            self.is_readonly,
+            self.is_hidden,
+            self.is_system,
+            self.is_arch,
+            self.is_exec,
+            self.is_name_utf8,
+        ) = _ATTR_DECODE[attr & 0xFF]
 
     def _date_decode(self, val: int) -> None:
         """Decode the MSCAB 32-bit date format"""
@@ -120,14 +129,14 @@ class CabFile:
         """Encode the MSCAB 32-bit date format"""
         if not self.date or self.date.year < 1980:
             return 0
-        return ((self.date.year - 1980) << 9) + (self.date.month << 5) + self.date.day
+        return ((self.date.year - 1980) << 9) | (self.date.month << 5) | self.date.day
 
     def _time_encode(self) -> int:
         """Encode the MSCAB 32-bit time format"""
         if not self.time:
             return 0
         return (
-            (self.time.hour << 11) + (self.time.minute << 5) + int(self.time.second / 2)
+            (self.time.hour << 11) | (self.time.minute << 5) | (self.time.second >> 1)
         )
 
     def __repr__(self) -> str:
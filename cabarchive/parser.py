@@ -7,13 +7,30 @@
 #
 # pylint: disable=protected-access,too-few-public-methods
 
-from typing import List, Optional, TYPE_CHECKING
+from typing import Callable, List, Tuple, Union, TYPE_CHECKING
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import mmap
+import os
 import struct
-import zlib
 import ntpath
 
+# ISA-L is a lot faster at inflating and has the same API as zlib
+try:
+    from isal import isal_zlib as zlib
+except ImportError:
+    import zlib  # type: ignore[no-redef]
+
 from cabarchive.file import CabFile
-from cabarchive.utils import FMT_CFFOLDER, FMT_CFHEADER_RESERVE, _checksum_compute
+from cabarchive.utils import (
+    STRUCT_CFHEADER,
+    STRUCT_CFHEADER_RESERVE,
+    STRUCT_CFFOLDER,
+    STRUCT_CFFILE,
+    STRUCT_CFDATA,
+    _checksum_compute,
+    _checksum_finalize,
+)
 from cabarchive.errors import CorruptionError, NotSupportedError
 
 if TYPE_CHECKING:
@@ -25,68 +42,75 @@ COMPRESSION_TYPE_MSZIP = 0x0001
 COMPRESSION_TYPE_QUANTUM = 0x0002
 COMPRESSION_TYPE_LZX = 0x0003
 
+# trusted pipelines can skip the CFDATA checksums without changing callers
+_SKIP_CHECKSUM = os.environ.get("CABARCHIVE_SKIP_CHECKSUM") == "1"
+
+# placeholder mtime for parsed files, which is replaced by the CFFILE date and
+# time; this avoids reading the clock for every file
+_MTIME_PLACEHOLDER = datetime.datetime(1980, 1, 1)
+
 
 class CabArchiveParser:
-    def __init__(self, cfarchive: "CabArchive", flattern: bool = False):
+    def __init__(
+        self,
+        cfarchive: "CabArchive",
+        flattern: bool = False,
+        verify_checksum: bool = True,
+    ):
         self.cfarchive: "CabArchive" = cfarchive
         self.flattern: bool = flattern
-        self._folder_data: List[bytearray] = []
-        self._buf: bytes = b""
+        self.verify_checksum: bool = verify_checksum and not _SKIP_CHECKSUM
+        self._folder_data: List[bytes] = []
+        self._buf: Union[bytes, mmap.mmap] = b""
+        self._buf_view: memoryview = memoryview(b"")
         self._header_reserved: bytes = b""
-        self._zdict: Optional[bytes] = None
         self._rsvd_block: int = 0
 
-    def parse_cffile(self, offset: int) -> int:
-        """Parse a CFFILE entry"""
-        fmt = "<I"  # uncompressed size
-        fmt += "I"  # uncompressed offset of this file in the folder
-        fmt += "H"  # index into the CFFOLDER area
-        fmt += "H"  # date
-        fmt += "H"  # time
-        fmt += "H"  # attribs
-        try:
-            (usize, uoffset, index, date, time, fattr) = struct.unpack_from(
-                fmt, self._buf, offset
-            )
-        except struct.error as e:
-            raise CorruptionError from e
+    def parse_cffiles(self, offset: int, nr_files: int) -> None:
+        """Parse all the CFFILE entries"""
+        buf = self._buf
+        folder_data = self._folder_data
+        unpack_from = STRUCT_CFFILE.unpack_from
+        for _ in range(nr_files):
+            try:
+                (usize, uoffset, index, date, time, fattr) = unpack_from(buf, offset)
+            except struct.error as e:
+                raise CorruptionError from e
+
+            # parse filename
+            offset += STRUCT_CFFILE.size
+            end = buf.find(b"\0", offset, offset + 256)
+            if end == -1:
+                raise CorruptionError("Filename is not NUL terminated")
+            filename = buf[offset:end].decode()
+
+            # add file
+            f = CabFile(mtime=_MTIME_PLACEHOLDER)
+            f._date_decode(date)
+            f._time_decode(time)
+            f._attr_decode(fattr)
+            try:
+                f.buf = bytes(folder_data[index][uoffset : uoffset + usize])
+            except IndexError as e:
+                raise CorruptionError(f"Failed to get buf for {filename}") from e
+            if len(f) != usize:
+                raise CorruptionError(
+                    "Corruption inside archive, %s is size %i but "
+                    "expected size %i" % (filename, len(f), usize)
+                )
+            if self.flattern:
+                filename = ntpath.basename(filename)
+            self.cfarchive[filename] = f
+
+            # move to next entry
+            offset = end + 1
 
-        # parse filename
-        offset += struct.calcsize(fmt)
-        filename = ""
-        for i in range(0, 255):
-            if self._buf[offset + i] == 0x0:
-                filename = self._buf[offset : offset + i].decode()
-                break
-
-        # add file
-        f = CabFile()
-        f._date_decode(date)
-        f._time_decode(time)
-        f._attr_decode(fattr)
+    def parse_cffolder(self, offset: int) -> Tuple[int, int, int]:
+        """Parse a CFFOLDER entry, returning the CFDATA offset, count and compression"""
         try:
-            f.buf = bytes(self._folder_data[index][uoffset : uoffset + usize])
-        except IndexError as e:
-            raise CorruptionError(f"Failed to get buf for {filename}") from e
-        if len(f) != usize:
-            raise CorruptionError(
-                "Corruption inside archive, %s is size %i but "
-                "expected size %i" % (filename, len(f), usize)
+            (offset, ndatab, compression) = STRUCT_CFFOLDER.unpack_from(
+                self._buf, offset
             )
-        if self.flattern:
-            filename = ntpath.basename(filename)
-        self.cfarchive[filename] = f
-
-        # return offset to next entry
-        return 16 + i + 1
-
-    def parse_cffolder(self, idx: int, offset: int) -> None:
-        """Parse a CFFOLDER entry"""
-        fmt = "<I"  # offset to CFDATA
-        fmt += "H"  # number of CFDATA blocks
-        fmt += "H"  # compression type
-        try:
-            (offset, ndatab, compression) = struct.unpack_from(fmt, self._buf, offset)
             compression &= COMPRESSION_MASK_TYPE
         except struct.error as e:
             raise CorruptionError from e
@@ -103,101 +127,126 @@ class CabArchiveParser:
                 raise NotSupportedError("LZX compression not supported")
             raise NotSupportedError(f"Compression type 0x{compression:x} not supported")
 
-        # parse CDATA
-        self._folder_data.append(bytearray())
+        return (offset, ndatab, compression)
+
+    def parse_cfdata_blocks(self, offset: int, ndatab: int, compression: int) -> bytes:
+        """Parse all the CFDATA entries of a folder"""
+        parse_cfdata: Callable[
+            [int, Union[bytes, memoryview]], Tuple[Union[bytes, memoryview], int]
+        ]
+        if compression == COMPRESSION_TYPE_MSZIP:
+            parse_cfdata = self.parse_cfdata_mszip
+        else:
+            parse_cfdata = self.parse_cfdata_none
+        chunks: List[Union[bytes, memoryview]] = []
+        zdict: Union[bytes, memoryview] = b""
         for _ in range(ndatab):
-            offset += self.parse_cfdata(idx, offset, compression)
+            buf, size = parse_cfdata(offset, zdict)
+            chunks.append(buf)
+            zdict = buf
+            offset += size
 
-    def parse_cfdata(self, idx: int, offset: int, compression: int) -> int:
-        """Parse a CFDATA entry"""
-        fmt = "<I"  # checksum
-        fmt += "H"  # compressed bytes
-        fmt += "H"  # uncompressed bytes
+        # join all the blocks with a single allocation
+        return b"".join(chunks)
+
+    def _parse_cfdata_payload(self, offset: int) -> Tuple[memoryview, int, int]:
+        """Parse a CFDATA header and verify the checksum of the payload"""
         try:
-            (checksum, blob_comp, blob_uncomp) = struct.unpack_from(
-                fmt, self._buf, offset
+            (checksum, blob_comp, blob_uncomp) = STRUCT_CFDATA.unpack_from(
+                self._buf, offset
             )
         except struct.error as e:
             raise CorruptionError from e
-        if compression == COMPRESSION_TYPE_NONE and blob_comp != blob_uncomp:
-            raise CorruptionError("Mismatched data %i != %i" % (blob_comp, blob_uncomp))
-        hdr_sz = struct.calcsize(fmt) + self._rsvd_block
-        buf_cfdata = self._buf[offset + hdr_sz : offset + hdr_sz + blob_comp]
+        hdr_sz = STRUCT_CFDATA.size + self._rsvd_block
+        buf_cfdata = self._buf_view[offset + hdr_sz : offset + hdr_sz + blob_comp]
 
         # verify checksum
-        if checksum != 0:
-            checksum_actual = _checksum_compute(buf_cfdata)
-            hdr = bytearray(struct.pack("<HH", blob_comp, blob_uncomp))
-            checksum_actual = _checksum_compute(hdr, checksum_actual)
+        if self.verify_checksum and checksum != 0:
+            checksum_actual = _checksum_finalize(
+                _checksum_compute(buf_cfdata), blob_comp, blob_uncomp
+            )
             if checksum_actual != checksum:
                 raise CorruptionError(
                     "Invalid checksum at {:x}, expected {:x}, got {:x}".format(
                         offset, checksum, checksum_actual
                     )
                 )
+        return buf_cfdata, blob_uncomp, blob_comp + hdr_sz
+
+    def parse_cfdata_none(
+        self, offset: int, _zdict: Union[bytes, memoryview]
+    ) -> Tuple[memoryview, int]:
+        """Parse an uncompressed CFDATA entry, returning the data and the entry size"""
+        buf_cfdata, blob_uncomp, size = self._parse_cfdata_payload(offset)
+        if len(buf_cfdata) != blob_uncomp:
+            raise CorruptionError(
+                "Mismatched data %i != %i" % (len(buf_cfdata), blob_uncomp)
+            )
+        return buf_cfdata, size
+
+    def parse_cfdata_mszip(
+        self, offset: int, zdict: Union[bytes, memoryview]
+    ) -> Tuple[bytes, int]:
+        """Parse a MSZIP CFDATA entry, returning the data and the entry size"""
+        buf_cfdata, blob_uncomp, size = self._parse_cfdata_payload(offset)
 
         # decompress Zlib data after removing *another* header...
-        if compression == COMPRESSION_TYPE_MSZIP:
-            if buf_cfdata[:2] != b"CK":
-                raise CorruptionError(
-                    f"Compression header invalid {buf_cfdata[:2].decode()}"
-                )
-            assert self._zdict is not None
-            decompress = zlib.decompressobj(-zlib.MAX_WBITS, zdict=self._zdict)
-            try:
-                buf = decompress.decompress(buf_cfdata[2:])
+        if buf_cfdata[:2] != b"CK":
+            raise CorruptionError(
+                f"Compression header invalid {bytes(buf_cfdata[:2]).decode()}"
+            )
+        # each block is a complete deflate stream that uses the previous
+        # block as history, so a decompressor cannot be reused
+        try:
+            decompress = zlib.decompressobj(-zlib.MAX_WBITS, zdict=zdict)
+            buf = decompress.decompress(buf_cfdata[2:])
+            if not decompress.eof:
                 buf += decompress.flush()
-            except zlib.error as e:
-                raise CorruptionError("Failed to decompress") from e
-            self._zdict = buf
-        else:
-            buf = buf_cfdata
-
+        except zlib.error as e:
+            raise CorruptionError("Failed to decompress") from e
         assert len(buf) == blob_uncomp
-        self._folder_data[idx] += buf
-        return blob_comp + hdr_sz
+        return buf, size
 
-    def parse(self, buf: bytes) -> None:
+    def parse(self, buf: Union[bytes, mmap.mmap]) -> None:
         # used as internal state
         self._buf = buf
-        if self._zdict is None:
-            self._zdict = b""
-
-        offset: int = 0
-
-        # read the file header
-        fmt = "<4s"  # signature
-        fmt += "xxxx"  # reserved1
-        fmt += "I"  # size
-        fmt += "xxxx"  # reserved2
-        fmt += "I"  # offset to CFFILE
-        fmt += "xxxx"  # reserved3
-        fmt += "BB"  # version minor, major
-        fmt += "H"  # no of CFFOLDERs
-        fmt += "H"  # no of CFFILEs
-        fmt += "H"  # flags
-        fmt += "H"  # setID
-        fmt += "H"  # cnt of cabs in set
+        self._buf_view = memoryview(buf)
         try:
-            (
-                signature,
-                size,
-                off_cffile,
-                version_minor,
-                version_major,
-                nr_folders,
-                nr_files,
-                flags,
-                set_id,
-                idx_cabinet,
-            ) = struct.unpack_from(fmt, self._buf, 0)
-        except struct.error as e:
-            raise CorruptionError from e
-        offset += struct.calcsize(fmt)
+            self._parse()
+        finally:
+            # every CabFile has its own copy, so drop the input and folder data
+            self._buf = b""
+            self._buf_view.release()
+            self._buf_view = memoryview(b"")
+            self._folder_data = []
+
+    def _parse(self) -> None:
+        offset: int = 0
 
-        # check magic bytes
-        if signature != b"MSCF":
+        # check magic bytes and version before unpacking the whole header
+        if len(self._buf) < STRUCT_CFHEADER.size:
+            raise CorruptionError("Header is truncated")
+        if self._buf[:4] != b"MSCF":
             raise NotSupportedError("Data is not application/vnd.ms-cab-compressed")
+        if self._buf[24:26] != b"\x03\x01":
+            raise NotSupportedError(
+                f"Version {self._buf[25]}.{self._buf[24]} not supported"
+            )
+
+        # read the file header
+        (
+            _,  # signature
+            size,
+            off_cffile,
+            _,  # version minor
+            _,  # version major
+            nr_folders,
+            nr_files,
+            flags,
+            set_id,
+            idx_cabinet,
+        ) = STRUCT_CFHEADER.unpack_from(self._buf, 0)
+        offset += STRUCT_CFHEADER.size
 
         # check size matches
         if size > len(self._buf):
@@ -207,12 +256,6 @@ class CabArchiveParser:
                 )
             )
 
-        # check version
-        if version_major != 1 or version_minor != 3:
-            raise NotSupportedError(
-                f"Version {version_major}.{version_minor} not supported"
-            )
-
         # chained cabs not supported
         if idx_cabinet != 0:
             raise NotSupportedError("Chained cab file not supported")
@@ -228,13 +271,13 @@ class CabArchiveParser:
         # reserved sizes
         if flags & 0x0004:
             try:
-                (rsvd_hdr, rsvd_folder, rsvd_block) = struct.unpack_from(
-                    FMT_CFHEADER_RESERVE, self._buf, offset
+                (rsvd_hdr, rsvd_folder, rsvd_block) = (
+                    STRUCT_CFHEADER_RESERVE.unpack_from(self._buf, offset)
                 )
             except struct.error as e:
                 raise CorruptionError from e
-            offset += struct.calcsize(FMT_CFHEADER_RESERVE)
-            self._header_reserved = buf[offset : offset + rsvd_hdr]
+            offset += STRUCT_CFHEADER_RESERVE.size
+            self._header_reserved = self._buf[offset : offset + rsvd_hdr]
             offset += rsvd_hdr
             self._rsvd_block = rsvd_block
         else:
@@ -245,13 +288,24 @@ class CabArchiveParser:
         self.cfarchive.set_id = set_id
 
         # parse CFFOLDER
-        for i in range(nr_folders):
-            self.parse_cffolder(i, offset)
-            offset += struct.calcsize(FMT_CFFOLDER) + rsvd_folder
+        folders: List[Tuple[int, int, int]] = []
+        for _ in range(nr_folders):
+            folders.append(self.parse_cffolder(offset))
+            offset += STRUCT_CFFOLDER.size + rsvd_folder
+
+        # parse CFDATA; each folder is compressed independently and zlib
+        # releases the GIL
+        if len(folders) > 1:
+            with ThreadPoolExecutor() as executor:
+                self._folder_data = list(
+                    executor.map(
+                        lambda folder: self.parse_cfdata_blocks(*folder), folders
+                    )
+                )
+        else:
+            self._folder_data = [
+                self.parse_cfdata_blocks(*folder) for folder in folders
+            ]
 
         # parse CFFILEs
-        for i in range(0, nr_files):
-            off_cffile += self.parse_cffile(off_cffile)
-
-        # allow reuse
-        self._zdict = None
+        self.parse_cffiles(off_cffile, nr_files)
@@ -10,28 +10,54 @@
 import os
 import sys
 import unittest
+from unittest import mock
 import datetime
 import subprocess
 import time
 import hashlib
+import struct
+import zlib
 
 # allows us to run this from the project root
 sys.path.append(os.path.realpath("."))
 
-from cabarchive import CabArchive, CabFile, CorruptionError
-from cabarchive.utils import _checksum_compute
+from cabarchive import CabArchive, CabFile, CorruptionError, NotSupportedError
+from cabarchive.utils import _checksum_compute, _checksum_finalize
+
+
+# the archive expected from test_create()
+_EXPECTED_CREATE = (
+    b"\x4D\x53\x43\x46\x00\x00\x00\x00\xFD\x00\x00\x00\x00\x00\x00\x00"
+    b"\x2C\x00\x00\x00\x00\x00\x00\x00\x03\x01\x01\x00\x02\x00\x00\x00"
+    b"\x22\x06\x00\x00\x5E\x00\x00\x00\x01\x00\x00\x00\x4D\x00\x00\x00"
+    b"\x00\x00\x00\x00\x00\x00\x6C\x22\xBA\x59\x20\x00\x68\x65\x6C\x6C"
+    b"\x6F\x2E\x63\x00\x4A\x00\x00\x00\x4D\x00\x00\x00\x00\x00\x6C\x22"
+    b"\xE7\x59\x20\x00\x77\x65\x6C\x63\x6F\x6D\x65\x2E\x63\x00\xBD\x5A"
+    b"\xA6\x30\x97\x00\x97\x00\x23\x69\x6E\x63\x6C\x75\x64\x65\x20\x3C"
+    b"\x73\x74\x64\x69\x6F\x2E\x68\x3E\x0D\x0A\x0D\x0A\x76\x6F\x69\x64"
+    b"\x20\x6D\x61\x69\x6E\x28\x76\x6F\x69\x64\x29\x0D\x0A\x7B\x0D\x0A"
+    b"\x20\x20\x20\x20\x70\x72\x69\x6E\x74\x66\x28\x22\x48\x65\x6C\x6C"
+    b"\x6F\x2C\x20\x77\x6F\x72\x6C\x64\x21\x5C\x6E\x22\x29\x3B\x0D\x0A"
+    b"\x7D\x0D\x0A\x23\x69\x6E\x63\x6C\x75\x64\x65\x20\x3C\x73\x74\x64"
+    b"\x69\x6F\x2E\x68\x3E\x0D\x0A\x0D\x0A\x76\x6F\x69\x64\x20\x6D\x61"
+    b"\x69\x6E\x28\x76\x6F\x69\x64\x29\x0D\x0A\x7B\x0D\x0A\x20\x20\x20"
+    b"\x20\x70\x72\x69\x6E\x74\x66\x28\x22\x57\x65\x6C\x63\x6F\x6D\x65"
+    b"\x21\x5C\x6E\x22\x29\x3B\x0D\x0A\x7D\x0D\x0A\x0D\x0A"
+)
 
 
 def _check_range(data: bytes, expected: bytes) -> None:
     assert data
     assert expected
+    if data == expected:
+        return
     failures = 0
     if len(data) != len(expected):
         print(f"different sizes, got {len(data)} expected {len(expected)}")
         failures += 1
-    for i in range(len(data)):
-        if data[i] != expected[i]:
-            print(f"@0x{i:02x} got 0x{data[i]:02x} expected 0x{expected[i]:02x}")
+    for i, (got, want) in enumerate(zip(data, expected)):
+        if got != want:
+            print(f"@0x{i:02x} got 0x{got:02x} expected 0x{want:02x}")
             failures += 1
             if failures > 10:
                 print("More than 10 failures, giving up...")
@@ -47,6 +73,19 @@ class TestInfParser(unittest.TestCase):
         csum = _checksum_compute(b"hello")
         self.assertEqual(csum, 0x6C6C6507)
 
+        # the 1, 2 and 3 byte tails are all handled differently
+        self.assertEqual(_checksum_compute(b"hel"), 0x68656C)
+        self.assertEqual(_checksum_compute(b"hello1"), 0x6C6C0A59)
+        self.assertEqual(_checksum_compute(b"hello12"), 0x6C03545A)
+        self.assertEqual(_checksum_compute(b"hello123", 0x12345678), 0x4D6A027F)
+
+        # folding in the sizes is the same as checksumming the CFDATA header
+        csum = _checksum_compute(b"hello123")
+        self.assertEqual(
+            _checksum_finalize(csum, 0x1234, 0x8000),
+            _checksum_compute(struct.pack("<HH", 0x1234, 0x8000), csum),
+        )
+
         # measure speed
         start = time.time()
         with open("data/random.bin", "rb") as f:
@@ -68,6 +107,17 @@ class TestInfParser(unittest.TestCase):
             hashlib.sha1(buf).hexdigest(), "74e94703c403aa93b16d01b088eb52e3a9c73288"
         )
 
+    def test_compress_level(self):
+        buf = b"".join(b"%i: %x\n" % (i, i * i) for i in range(20000))
+        arc = CabArchive()
+        arc["test.txt"] = CabFile(buf, mtime=datetime.datetime(2020, 1, 1))
+        buf_fast = arc.save(compress=True, compress_level=1)
+        buf_best = arc.save(compress=True, compress_level=9)
+        self.assertNotEqual(buf_fast, buf_best)
+        self.assertGreater(len(buf_fast), len(buf_best))
+        self.assertEqual(CabArchive(buf_fast)["test.txt"].buf, buf)
+        self.assertEqual(CabArchive(buf_best)["test.txt"].buf, buf)
+
     def test_values(self):
         # parse junk
         with self.assertRaises(CorruptionError):
@@ -77,6 +127,25 @@ class TestInfParser(unittest.TestCase):
         except FileNotFoundError as _:
             pass
 
+        # filename without a NUL terminator within 256 bytes
+        with open("data/simple.cab", "rb") as f:
+            buf = bytearray(f.read())
+        off_cffile = struct.unpack_from("<I", buf, 16)[0]
+        buf += buf[off_cffile : off_cffile + 16] + b"x" * 256
+        struct.pack_into("<I", buf, 8, len(buf))
+        struct.pack_into("<I", buf, 16, len(buf) - 16 - 256)
+        with self.assertRaises(CorruptionError):
+            CabArchive(bytes(buf))
+
+        # attributes are only truth-tested
+        for is_hidden in [2, None]:
+            arc = CabArchive()
+            arc["test.txt"] = CabFile(b"test123")
+            arc["test.txt"].is_hidden = is_hidden
+            cff = CabArchive(arc.save())["test.txt"]
+            self.assertEqual(cff.is_hidden, bool(is_hidden))
+            self.assertFalse(cff.is_system)
+
     def test_simple(self):
         with open("data/simple.cab", "rb") as f:
             old = f.read()
@@ -89,6 +158,68 @@ class TestInfParser(unittest.TestCase):
         self.assertEqual(cff.date.year, 2015)
         _check_range(arc.save(), old)
 
+    def test_verify_checksum(self):
+        with open("data/simple.cab", "rb") as f:
+            buf = bytearray(f.read())
+
+        # corrupt the CFDATA checksum
+        buf[0x45] ^= 0xFF
+        with self.assertRaises(CorruptionError):
+            CabArchive(bytes(buf))
+        arc = CabArchive(bytes(buf), verify_checksum=False)
+        self.assertEqual(arc["test.txt"].buf, b"test123")
+
+        # the environment override takes precedence
+        with mock.patch("cabarchive.parser._SKIP_CHECKSUM", True):
+            arc = CabArchive(bytes(buf), verify_checksum=True)
+        self.assertEqual(arc["test.txt"].buf, b"test123")
+
+    def test_not_supported(self):
+        with open("data/simple.cab", "rb") as f:
+            buf = bytearray(f.read())
+        with self.assertRaises(NotSupportedError):
+            CabArchive(b"MSCX" + bytes(buf[4:]))
+
+        # version 1.4
+        buf[24] = 0x04
+        with self.assertRaises(NotSupportedError):
+            CabArchive(bytes(buf))
+
+    def test_parse_file(self):
+        arc = CabArchive()
+        arc.parse_file("data/large-compressed.cab")
+        arc.save_file("/tmp/test.cab")
+        arc = CabArchive()
+        arc.parse_file("/tmp/test.cab")
+        cff = arc["random.bin"]
+        self.assertEqual(
+            hashlib.sha1(cff.buf).hexdigest(),
+            "8497fe89c41871e3cbd7955e13321e056dfbd170",
+        )
+
+        # the mapping can still be closed when the archive is corrupt
+        with open("data/compressed.cab", "rb") as f:
+            buf = bytearray(f.read())
+        buf[-5] ^= 0xFF
+        with open("/tmp/test.cab", "wb") as f:
+            f.write(buf)
+        with self.assertRaises(CorruptionError):
+            CabArchive().parse_file("/tmp/test.cab")
+
+    def test_unterminated(self):
+        # a MSZIP block without the final deflate block is still accepted
+        compressobj = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        blob = b"CK" + compressobj.compress(b"test123") + compressobj.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+        arc = CabArchive()
+        arc["test.txt"] = CabFile(b"test123")
+        buf = arc.save(compress=True)
+        off_cfdata = struct.unpack_from("<I", buf, 36)[0]
+        buf = buf[:off_cfdata] + struct.pack("<IHH", 0, len(blob), 7) + blob
+        buf = buf[:8] + struct.pack("<I", len(buf)) + buf[12:]
+        self.assertEqual(CabArchive(buf)["test.txt"].buf, b"test123")
+
     def test_compressed(self):
         with open("data/compressed.cab", "rb") as f:
             old = f.read()
@@ -195,25 +326,7 @@ class TestInfParser(unittest.TestCase):
         data = arc.save(False)
         with open("/tmp/test.cab", "wb") as f:
             f.write(data)
-        expected = (
-            b"\x4D\x53\x43\x46\x00\x00\x00\x00\xFD\x00\x00\x00\x00\x00\x00\x00"
-            b"\x2C\x00\x00\x00\x00\x00\x00\x00\x03\x01\x01\x00\x02\x00\x00\x00"
-            b"\x22\x06\x00\x00\x5E\x00\x00\x00\x01\x00\x00\x00\x4D\x00\x00\x00"
-            b"\x00\x00\x00\x00\x00\x00\x6C\x22\xBA\x59\x20\x00\x68\x65\x6C\x6C"
-            b"\x6F\x2E\x63\x00\x4A\x00\x00\x00\x4D\x00\x00\x00\x00\x00\x6C\x22"
-            b"\xE7\x59\x20\x00\x77\x65\x6C\x63\x6F\x6D\x65\x2E\x63\x00\xBD\x5A"
-            b"\xA6\x30\x97\x00\x97\x00\x23\x69\x6E\x63\x6C\x75\x64\x65\x20\x3C"
-            b"\x73\x74\x64\x69\x6F\x2E\x68\x3E\x0D\x0A\x0D\x0A\x76\x6F\x69\x64"
-            b"\x20\x6D\x61\x69\x6E\x28\x76\x6F\x69\x64\x29\x0D\x0A\x7B\x0D\x0A"
-            b"\x20\x20\x20\x20\x70\x72\x69\x6E\x74\x66\x28\x22\x48\x65\x6C\x6C"
-            b"\x6F\x2C\x20\x77\x6F\x72\x6C\x64\x21\x5C\x6E\x22\x29\x3B\x0D\x0A"
-            b"\x7D\x0D\x0A\x23\x69\x6E\x63\x6C\x75\x64\x65\x20\x3C\x73\x74\x64"
-            b"\x69\x6F\x2E\x68\x3E\x0D\x0A\x0D\x0A\x76\x6F\x69\x64\x20\x6D\x61"
-            b"\x69\x6E\x28\x76\x6F\x69\x64\x29\x0D\x0A\x7B\x0D\x0A\x20\x20\x20"
-            b"\x20\x70\x72\x69\x6E\x74\x66\x28\x22\x57\x65\x6C\x63\x6F\x6D\x65"
-            b"\x21\x5C\x6E\x22\x29\x3B\x0D\x0A\x7D\x0D\x0A\x0D\x0A"
-        )
-        _check_range(bytearray(data), bytearray(expected))
+        _check_range(data, _EXPECTED_CREATE)
 
         # use cabextract to test validity
         try:
@@ -225,8 +338,7 @@ class TestInfParser(unittest.TestCase):
 
         # check we can parse what we just created
         arc = CabArchive()
-        with open("/tmp/test.cab", "rb") as f:
-            arc.parse(f.read())
+        arc.parse(data)
 
         # add an extra file
         arc["test.inf"] = CabFile(b"$CHICAGO$")
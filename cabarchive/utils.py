@@ -7,7 +7,9 @@
 #
 # pylint: disable=protected-access,too-few-public-methods
 
-from typing import List
+import struct
+
+from typing import List, Union
 
 FMT_CFHEADER = "<4sxxxxIxxxxIxxxxBBHHHHH"
 FMT_CFHEADER_RESERVE = "<HBB"
@@ -15,34 +17,57 @@ FMT_CFFOLDER = "<IHH"
 FMT_CFFILE = "<IIHHHH"
 FMT_CFDATA = "<IHH"
 
+# signature, size, offset to CFFILE, version minor, version major,
+# no of CFFOLDERs, no of CFFILEs, flags, setID, cnt of cabs in set
+STRUCT_CFHEADER = struct.Struct(FMT_CFHEADER)
+
+# reserved header size, reserved folder size, reserved block size
+STRUCT_CFHEADER_RESERVE = struct.Struct(FMT_CFHEADER_RESERVE)
+
+# offset to CFDATA, number of CFDATA blocks, compression type
+STRUCT_CFFOLDER = struct.Struct(FMT_CFFOLDER)
+
+# uncompressed size, uncompressed offset of this file in the folder,
+# index into the CFFOLDER area, date, time, attribs
+STRUCT_CFFILE = struct.Struct(FMT_CFFILE)
 
-def _chunkify(arr: bytes, size: int) -> List[bytearray]:
-    """Split up a bytestream into chunks"""
-    arrs = []
-    for i in range(0, len(arr), size):
-        chunk = bytearray(arr[i : i + size])
-        arrs.append(chunk)
-    return arrs
+# checksum, compressed bytes, uncompressed bytes
+STRUCT_CFDATA = struct.Struct(FMT_CFDATA)
 
 
-def _checksum_compute(content: bytes, seed: int = 0) -> int:
+def _chunkify(arr: bytes, size: int) -> List[memoryview]:
+    """Split up a bytestream into chunks without copying the data"""
+    view = memoryview(arr)
+    return [view[i : i + size] for i in range(0, len(view), size)]
+
+
+def _checksum_compute(content: Union[bytes, memoryview], seed: int = 0) -> int:
     """Compute the MS cabinet checksum"""
     csum = seed
-    chunks = _chunkify(content, 4)
-    for chunk in chunks:
-        if len(chunk) == 4:
-            ul = chunk[0]
-            ul |= chunk[1] << 8
-            ul |= chunk[2] << 16
-            ul |= chunk[3] << 24
-        else:
-            # WTF: I can only assume this is a typo from the original
-            # author of the cabinet file specification
-            if len(chunk) == 3:
-                ul = (chunk[0] << 16) | (chunk[1] << 8) | chunk[2]
-            elif len(chunk) == 2:
-                ul = (chunk[0] << 8) | chunk[1]
-            elif len(chunk) == 1:
-                ul = chunk[0]
-        csum ^= ul
+    len4 = len(content) & ~3
+    if len4:
+        # XOR all the little-endian 32-bit words together by repeatedly
+        # folding the upper half of one big integer onto the lower half;
+        # the first fold is done while converting to avoid a large mask
+        view = memoryview(content)
+        half = ((len4 // 4 + 1) // 2) * 4
+        val = int.from_bytes(view[:half], "little")
+        val ^= int.from_bytes(view[half:len4], "little")
+        words = half // 4
+        while words > 1:
+            half = (words + 1) // 2
+            shift = half * 32
+            val = (val >> shift) ^ (val & ((1 << shift) - 1))
+            words = half
+        csum ^= val
+    if len4 != len(content):
+        # WTF: I can only assume this is a typo from the original
+        # author of the cabinet file specification
+        csum ^= int.from_bytes(content[len4:], "big")
     return csum
+
+
+def _checksum_finalize(csum: int, comp_len: int, uncomp_len: int) -> int:
+    """Fold the CFDATA compressed and uncompressed sizes into the checksum"""
+    # this is the same as checksumming the little-endian <HH header
+    return csum ^ ((uncomp_len << 16) | comp_len)
@@ -7,33 +7,51 @@
 #
 # pylint: disable=protected-access,too-few-public-methods
 
-from typing import List, TYPE_CHECKING
-import struct
+from typing import List, Sequence, Tuple, Union, TYPE_CHECKING
+from concurrent.futures import ThreadPoolExecutor
+import itertools
 import zlib
 
 from cabarchive.file import CabFile
 from cabarchive.utils import (
-    FMT_CFHEADER,
-    FMT_CFFOLDER,
-    FMT_CFFILE,
-    FMT_CFDATA,
+    STRUCT_CFHEADER,
+    STRUCT_CFFOLDER,
+    STRUCT_CFFILE,
+    STRUCT_CFDATA,
     _chunkify,
     _checksum_compute,
+    _checksum_finalize,
 )
 
 if TYPE_CHECKING:
     from cabarchive.archive import CabArchive
 
 
+def _compress_chunk(chunk: Union[bytes, memoryview], compress_level: int) -> bytes:
+    """Compress a chunk of data into a MSZIP block"""
+    compressobj = zlib.compressobj(compress_level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return b"CK" + compressobj.compress(chunk) + compressobj.flush()
+
+
 class CabArchiveWriter:
     def __init__(
-        self, cfarchive: "CabArchive", compress: bool = False, sort: bool = True
+        self,
+        cfarchive: "CabArchive",
+        compress: bool = False,
+        sort: bool = True,
+        compress_level: int = 6,
     ) -> None:
         self.cfarchive: "CabArchive" = cfarchive
         self.compress: bool = compress
         self.sort: bool = sort
+        self.compress_level: int = compress_level
 
     def write(self) -> bytes:
+        """Write the archive"""
+        return bytes(self.write_buffer())
+
+    def write_buffer(self) -> bytearray:
+        """Write the archive into a mutable buffer without a final copy"""
         # sort files before export
         cffiles: List[CabFile] = []
         if self.sort:
@@ -43,39 +61,44 @@ class CabArchiveWriter:
             cffiles.extend(self.cfarchive.values())
 
         # create linear CFDATA block
-        cfdata_linear = bytearray()
-        for f in cffiles:
-            if f.buf:
-                cfdata_linear += f.buf
+        cfdata_linear = b"".join(f.buf for f in cffiles if f.buf)
 
         # _chunkify and compress with a fixed size
         chunks = _chunkify(cfdata_linear, 0x8000)
-        if self.compress:
-            chunks_zlib = []
-            for chunk in chunks:
-                compressobj = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
-                chunk_zlib = bytearray(b"CK")
-                chunk_zlib += compressobj.compress(chunk)
-                chunk_zlib += compressobj.flush()
-                chunks_zlib.append(chunk_zlib)
-        else:
+        chunks_zlib: Sequence[Union[bytes, memoryview]]
+        if not self.compress:
             chunks_zlib = chunks
+        elif len(chunks) > 1:
+            # each block is compressed independently and zlib releases the GIL
+            with ThreadPoolExecutor() as executor:
+                chunks_zlib = list(
+                    executor.map(
+                        _compress_chunk, chunks, itertools.repeat(self.compress_level)
+                    )
+                )
+        else:
+            chunks_zlib = [
+                _compress_chunk(chunk, self.compress_level) for chunk in chunks
+            ]
+
+        # each filename is only encoded once
+        cffile_names: List[Tuple[CabFile, bytes]] = [
+            (f, f._filename_win32_utf8) for f in cffiles if f._filename_win32
+        ]
+        cffile_size = 0
+        for _, name in cffile_names:
+            cffile_size += STRUCT_CFFILE.size + len(name) + 1
 
         # create header
-        archive_size = struct.calcsize(FMT_CFHEADER)
-        archive_size += struct.calcsize(FMT_CFFOLDER)
-        for f in cffiles:
-            if not f._filename_win32:
-                continue
-            archive_size += (
-                struct.calcsize(FMT_CFFILE) + len(f._filename_win32.encode()) + 1
-            )
+        offset = STRUCT_CFHEADER.size
+        offset += STRUCT_CFFOLDER.size
+        archive_size = offset + cffile_size
         for chunk in chunks_zlib:
-            archive_size += struct.calcsize(FMT_CFDATA) + len(chunk)
-        offset = struct.calcsize(FMT_CFHEADER)
-        offset += struct.calcsize(FMT_CFFOLDER)
-        data = struct.pack(
-            FMT_CFHEADER,
+            archive_size += STRUCT_CFDATA.size + len(chunk)
+        data = bytearray(archive_size)
+        STRUCT_CFHEADER.pack_into(
+            data,
+            0,
             b"MSCF",  # signature
             archive_size,  # complete size
             offset,  # offset to CFFILE
@@ -87,27 +110,25 @@ class CabArchiveWriter:
             self.cfarchive.set_id,  # setID
             0,
         )  # cnt of cabs in set
+        pos = STRUCT_CFHEADER.size
 
         # create folder
-        for f in cffiles:
-            if not f._filename_win32:
-                continue
-            offset += struct.calcsize(FMT_CFFILE)
-            offset += len(f._filename_win32.encode()) + 1
-        data += struct.pack(
-            FMT_CFFOLDER,
+        offset += cffile_size
+        STRUCT_CFFOLDER.pack_into(
+            data,
+            pos,
             offset,  # offset to CFDATA
             len(chunks),  # number of CFDATA blocks
             self.compress,
         )  # compression type
+        pos += STRUCT_CFFOLDER.size
 
         # create each CFFILE
         index_into = 0
-        for f in cffiles:
-            if not f._filename_win32:
-                continue
-            data += struct.pack(
-                FMT_CFFILE,
+        for f, name in cffile_names:
+            STRUCT_CFFILE.pack_into(
+                data,
+                pos,
                 len(f),  # uncompressed size
                 index_into,  # uncompressed offset
                 0,  # index into CFFOLDER
@@ -115,7 +136,9 @@ class CabArchiveWriter:
                 f._time_encode(),  # time
                 f._attr_encode(),
             )  # attribs
-            data += f._filename_win32.encode() + b"\0"
+            pos += STRUCT_CFFILE.size
+            data[pos : pos + len(name)] = name
+            pos += len(name) + 1  # the NUL terminator is already zeroed
             index_into += len(f)
 
         # create each CFDATA
@@ -125,16 +148,20 @@ class CabArchiveWriter:
 
             # first do the 'checksum' on the data, then the partial
             # header. slightly crazy, but anyway
-            checksum = _checksum_compute(chunk_zlib)
-            hdr = bytearray(struct.pack("<HH", len(chunk_zlib), len(chunk)))
-            checksum = _checksum_compute(hdr, checksum)
-            data += struct.pack(
-                FMT_CFDATA,
+            checksum = _checksum_finalize(
+                _checksum_compute(chunk_zlib), len(chunk_zlib), len(chunk)
+            )
+            STRUCT_CFDATA.pack_into(
+                data,
+                pos,
                 checksum,  # checksum
                 len(chunk_zlib),  # compressed bytes
                 len(chunk),
             )  # uncompressed bytes
-            data += chunk_zlib
+            pos += STRUCT_CFDATA.size
+            data[pos : pos + len(chunk_zlib)] = chunk_zlib
+            pos += len(chunk_zlib)
 
-        # return bytearray
+        # the archive was written in place without any reallocation
+        assert pos == archive_size
         return data
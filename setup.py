@@ -21,6 +21,9 @@ setup(
     packages=[
         "cabarchive",
     ],
+    extras_require={
+        "fast": ["isal>=1.5"],
+    },
     include_package_data=True,
     zip_safe=False,
     classifiers=[